@@ -1,5 +1,5 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox, simpledialog, filedialog
 import requests
 import json
 import pyperclip
@@ -9,11 +9,223 @@ import base64
 import io
 import re
 import html
+import bisect
+import heapq
+import hashlib
+import sqlite3
+import time
+import uuid
+import zipfile
 from datetime import datetime
 from PIL import Image, ImageGrab
 import tempfile
 import win32clipboard
-from io import BytesIO
+
+class ApkgWriter:
+    """Write notes and media straight into an Anki .apkg package (no AnkiConnect needed).
+
+    Notes go into an on-disk SQLite collection and media files are streamed into
+    the zip as they are added, so memory use stays flat for large builds.
+    """
+
+    FIELD_SEPARATOR = "\x1f"
+
+    # Fixed id for the "Basic" note type: Anki reuses a note type on import only
+    # when the id matches, so repeat exports must not mint a new one each time
+    MODEL_ID = 1588276534091
+
+    SCHEMA = """
+        CREATE TABLE col (
+            id integer primary key, crt integer not null, mod integer not null,
+            scm integer not null, ver integer not null, dty integer not null,
+            usn integer not null, ls integer not null, conf text not null,
+            models text not null, decks text not null, dconf text not null,
+            tags text not null
+        );
+        CREATE TABLE notes (
+            id integer primary key, guid text not null, mid integer not null,
+            mod integer not null, usn integer not null, tags text not null,
+            flds text not null, sfld integer not null, csum integer not null,
+            flags integer not null, data text not null
+        );
+        CREATE TABLE cards (
+            id integer primary key, nid integer not null, did integer not null,
+            ord integer not null, mod integer not null, usn integer not null,
+            type integer not null, queue integer not null, due integer not null,
+            ivl integer not null, factor integer not null, reps integer not null,
+            lapses integer not null, left integer not null, odue integer not null,
+            odid integer not null, flags integer not null, data text not null
+        );
+        CREATE TABLE revlog (
+            id integer primary key, cid integer not null, usn integer not null,
+            ease integer not null, ivl integer not null, lastIvl integer not null,
+            factor integer not null, time integer not null, type integer not null
+        );
+        CREATE TABLE graves (
+            usn integer not null, oid integer not null, type integer not null
+        );
+        CREATE INDEX ix_notes_usn on notes (usn);
+        CREATE INDEX ix_cards_usn on cards (usn);
+        CREATE INDEX ix_revlog_usn on revlog (usn);
+        CREATE INDEX ix_cards_nid on cards (nid);
+        CREATE INDEX ix_cards_sched on cards (did, queue, due);
+        CREATE INDEX ix_revlog_cid on revlog (cid);
+        CREATE INDEX ix_notes_csum on notes (csum);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.now = int(time.time())
+        self.next_id = int(time.time() * 1000)
+        self.model_id = self.MODEL_ID
+        self.deck_ids = {}
+        self.media_map = {}
+        self.media_names = set()
+        self.note_count = 0
+
+        # Collection lives in a temp file; it is copied into the zip on close
+        db_fd, self.db_path = tempfile.mkstemp(suffix=".anki2")
+        os.close(db_fd)
+        self.db = sqlite3.connect(self.db_path)
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.executescript(self.SCHEMA)
+
+        self.zip_file = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+
+    def new_id(self):
+        """Return a unique millisecond-style id for notes, cards and decks"""
+        self.next_id += 1
+        return self.next_id
+
+    def get_deck_id(self, deck_name):
+        """Return the id for a deck name, registering the deck on first use"""
+        if deck_name not in self.deck_ids:
+            self.deck_ids[deck_name] = self.new_id()
+        return self.deck_ids[deck_name]
+
+    def add_note(self, deck_name, front, back="", tags=()):
+        """Add a "Basic" note with a single card to the given deck"""
+        note_id = self.new_id()
+        card_id = self.new_id()
+        deck_id = self.get_deck_id(deck_name)
+        self.note_count += 1
+
+        # Sort field and checksum are taken from the first field's plain text
+        sort_field = html.unescape(re.sub(r'<[^>]+>', '', front)).strip()
+        checksum = int(hashlib.sha1(sort_field.encode('utf-8')).hexdigest()[:8], 16)
+        tag_string = f" {' '.join(tags)} " if tags else ""
+        fields = self.FIELD_SEPARATOR.join([front, back])
+
+        self.db.execute(
+            "INSERT INTO notes VALUES (?, ?, ?, ?, -1, ?, ?, ?, ?, 0, '')",
+            (note_id, uuid.uuid4().hex, self.model_id, self.now, tag_string,
+             fields, sort_field, checksum))
+        self.db.execute(
+            "INSERT INTO cards VALUES (?, ?, ?, 0, ?, -1, 0, 0, ?, 0, 0, 0, 0, 0, 0, 0, 0, '')",
+            (card_id, note_id, deck_id, self.now, self.note_count))
+        return note_id
+
+    def add_media(self, filename, path):
+        """Stream one media file from disk into the package under its Anki filename"""
+        # Anki keeps only one file per name, so a duplicate would show the wrong image
+        if filename in self.media_names:
+            raise ValueError(f"Media file '{filename}' is already in the package")
+        self.media_names.add(filename)
+
+        entry_name = str(len(self.media_map))
+        # Images are already compressed; deflating them again only costs time
+        self.zip_file.write(path, entry_name, compress_type=zipfile.ZIP_STORED)
+        self.media_map[entry_name] = filename
+        return filename
+
+    def build_collection_row(self):
+        """Build the single col row holding the model, deck and config JSON"""
+        model = {
+            "id": self.model_id, "name": "Basic", "type": 0, "mod": self.now, "usn": -1,
+            "sortf": 0, "did": next(iter(self.deck_ids.values()), 1),
+            "tmpls": [{
+                "name": "Card 1", "ord": 0, "qfmt": "{{Front}}",
+                "afmt": "{{FrontSide}}\n\n<hr id=answer>\n\n{{Back}}",
+                "did": None, "bqfmt": "", "bafmt": "",
+            }],
+            "flds": [
+                {"name": "Front", "ord": 0, "sticky": False, "rtl": False,
+                 "font": "Arial", "size": 20, "media": []},
+                {"name": "Back", "ord": 1, "sticky": False, "rtl": False,
+                 "font": "Arial", "size": 20, "media": []},
+            ],
+            "css": ".card {\n font-family: arial;\n font-size: 20px;\n text-align: center;\n"
+                   " color: black;\n background-color: white;\n}\n",
+            "latexPre": "\\documentclass[12pt]{article}\n\\special{papersize=3in,5in}\n"
+                        "\\usepackage[utf8]{inputenc}\n\\usepackage{amssymb,amsmath}\n"
+                        "\\pagestyle{empty}\n\\setlength{\\parindent}{0in}\n\\begin{document}\n",
+            "latexPost": "\\end{document}",
+            "req": [[0, "any", [0]]],
+            "tags": [], "vers": [],
+        }
+
+        def deck_json(deck_id, name):
+            return {
+                "id": deck_id, "name": name, "mod": self.now, "usn": -1,
+                "lrnToday": [0, 0], "revToday": [0, 0], "newToday": [0, 0],
+                "timeToday": [0, 0], "collapsed": False, "browserCollapsed": False,
+                "desc": "", "dyn": 0, "conf": 1, "extendNew": 0, "extendRev": 0,
+            }
+
+        decks = {"1": deck_json(1, "Default")}
+        for name, deck_id in self.deck_ids.items():
+            decks[str(deck_id)] = deck_json(deck_id, name)
+
+        dconf = {"1": {
+            "id": 1, "name": "Default", "mod": 0, "usn": 0, "maxTaken": 60,
+            "autoplay": True, "timer": 0, "replayq": True, "dyn": False,
+            "new": {"bury": True, "delays": [1, 10], "initialFactor": 2500,
+                    "ints": [1, 4, 7], "order": 1, "perDay": 20, "separate": True},
+            "lapse": {"delays": [10], "leechAction": 0, "leechFails": 8,
+                      "minInt": 1, "mult": 0},
+            "rev": {"bury": True, "ease4": 1.3, "fuzz": 0.05, "ivlFct": 1,
+                    "maxIvl": 36500, "minSpace": 1, "perDay": 100},
+        }}
+
+        conf = {
+            "activeDecks": [1], "curDeck": 1, "newSpread": 0, "collapseTime": 1200,
+            "timeLim": 0, "estTimes": True, "dueCounts": True, "curModel": str(self.model_id),
+            "nextPos": self.note_count + 1, "sortType": "noteFld", "sortBackwards": False,
+            "addToCur": True,
+        }
+
+        return (1, self.now, self.now * 1000, self.now * 1000, 11, 0, 0, 0,
+                json.dumps(conf), json.dumps({str(self.model_id): model}),
+                json.dumps(decks), json.dumps(dconf), json.dumps({}))
+
+    def close(self):
+        """Finish the collection and write it plus the media map into the package"""
+        try:
+            self.db.execute("INSERT INTO col VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            self.build_collection_row())
+            self.db.commit()
+            self.db.close()
+
+            self.zip_file.write(self.db_path, "collection.anki2")
+            self.zip_file.writestr("media", json.dumps(self.media_map))
+            self.zip_file.close()
+        finally:
+            # The temp collection is never needed again, whether or not close succeeded
+            self.db.close()
+            if os.path.exists(self.db_path):
+                os.remove(self.db_path)
+
+    def discard(self):
+        """Abandon the package and remove any partially written files"""
+        self.db.close()
+        try:
+            self.zip_file.close()
+        except Exception as e:
+            print(f"Error closing discarded package: {e}")
+        for path in (self.db_path, self.path):
+            if os.path.exists(path):
+                os.remove(path)
 
 class AnkiDeckManager:
     def __init__(self):
@@ -32,6 +244,28 @@ class AnkiDeckManager:
         # Track selected deck
         self.selected_deck = None
         
+        # Deck browser settings
+        self.deck_separator = "::"
+        self.deck_page_size = 200
+        self.search_result_limit = 200
+        self.recent_deck_limit = 5
+        self.search_delay_ms = 150
+        self.search_job = None
+        
+        # Deck browser indexes (rebuilt by build_deck_index)
+        self.deck_children = {}
+        self.deck_tokens = {}
+        self.sorted_deck_tokens = []
+        self.deck_item_names = {}
+        self.more_items = {}
+        
+        # Open .apkg export (None while notes go to AnkiConnect)
+        self.apkg_writer = None
+        
+        # Embedded image decoding: payloads spill to disk above image_spool_size
+        self.image_spool_size = 1024 * 1024
+        self.base64_chunk_size = 64 * 1024
+        
         self.create_widgets()
         self.refresh_deck_list()
         
@@ -66,9 +300,25 @@ class AnkiDeckManager:
                                   font=('Arial', 12, 'bold'), bg='#f0f0f0')
         deck_frame.pack(padx=20, pady=10, fill='both', expand=True)
         
-        # Deck list
-        self.deck_listbox = tk.Listbox(deck_frame, height=8, font=('Arial', 10))
-        self.deck_listbox.pack(padx=10, pady=10, fill='both', expand=True)
+        # Type-ahead search
+        search_frame = tk.Frame(deck_frame, bg='#f0f0f0')
+        search_frame.pack(padx=10, pady=(10, 0), fill='x')
+        
+        tk.Label(search_frame, text="Search:", font=('Arial', 10), bg='#f0f0f0').pack(side='left')
+        
+        self.search_var = tk.StringVar()
+        self.search_entry = tk.Entry(search_frame, textvariable=self.search_var, font=('Arial', 10))
+        self.search_entry.pack(side='left', padx=5, fill='x', expand=True)
+        
+        # Deck tree (children are inserted lazily when a node is expanded)
+        tree_frame = tk.Frame(deck_frame, bg='#f0f0f0')
+        tree_frame.pack(padx=10, pady=10, fill='both', expand=True)
+        
+        self.deck_tree = ttk.Treeview(tree_frame, show='tree', selectmode='browse', height=8)
+        tree_scrollbar = ttk.Scrollbar(tree_frame, orient='vertical', command=self.deck_tree.yview)
+        self.deck_tree.configure(yscrollcommand=tree_scrollbar.set)
+        tree_scrollbar.pack(side='right', fill='y')
+        self.deck_tree.pack(side='left', fill='both', expand=True)
         
         # Deck management buttons
         button_frame = tk.Frame(deck_frame, bg='#f0f0f0')
@@ -112,14 +362,21 @@ class AnkiDeckManager:
                                         bg='#9C27B0', fg='white', font=('Arial', 12, 'bold'))
         self.create_note_btn.pack(padx=10, pady=10)
         
+        # Offline export: notes are written to an .apkg instead of AnkiConnect
+        self.export_btn = tk.Button(note_frame, text="Start .apkg Export", 
+                                   command=self.toggle_apkg_export, bg='#607D8B', fg='white')
+        self.export_btn.pack(padx=10, pady=(0, 10))
+        
         # Status label
         self.status_label = tk.Label(self.root, text="Ready", 
                                     font=('Arial', 10), bg='#f0f0f0')
         self.status_label.pack(pady=5)
         
-        # Bind listbox selection - using both events for better reliability
-        self.deck_listbox.bind('<<ListboxSelection>>', self.on_deck_select)
-        self.deck_listbox.bind('<Button-1>', self.on_deck_click)
+        # Bind tree selection, lazy expansion and type-ahead search
+        self.deck_tree.bind('<<TreeviewSelect>>', self.on_deck_select)
+        self.deck_tree.bind('<<TreeviewOpen>>', self.on_deck_open)
+        self.deck_tree.tag_configure('parent', foreground='#757575')
+        self.search_var.trace_add('write', self.on_search_change)
     
     def anki_request(self, action, **params):
         """Send request to AnkiConnect"""
@@ -137,6 +394,55 @@ class AnkiDeckManager:
             self.status_label.config(text=f"Error connecting to Anki: {e}", fg='red')
             return None
     
+    def add_note(self, note_data):
+        """Add a note through AnkiConnect, or into the open .apkg export"""
+        if self.apkg_writer:
+            note_id = self.apkg_writer.add_note(note_data['deckName'], note_data['fields']['Front'],
+                                                note_data['fields']['Back'], note_data['tags'])
+            return {'result': note_id, 'error': None}
+        return self.anki_request("addNote", note=note_data)
+    
+    def store_media_file(self, filename, path):
+        """Store a media file through AnkiConnect, or into the open .apkg export"""
+        if self.apkg_writer:
+            self.apkg_writer.add_media(filename, path)
+            return {'result': filename, 'error': None}
+        # AnkiConnect reads the file itself, so no base64 copy is sent over HTTP
+        return self.anki_request("storeMediaFile", filename=filename, path=os.path.abspath(path))
+    
+    def toggle_apkg_export(self):
+        """Start writing notes to an .apkg file, or finish the current export"""
+        if self.apkg_writer is None:
+            path = filedialog.asksaveasfilename(title="Export Notes to .apkg",
+                                                defaultextension=".apkg",
+                                                filetypes=[("Anki Deck Package", "*.apkg")])
+            if not path:
+                return
+            
+            try:
+                self.apkg_writer = ApkgWriter(path)
+            except Exception as e:
+                messagebox.showerror("Error", f"Could not start export: {e}")
+                return
+            
+            self.export_btn.config(text="Finish .apkg Export")
+            self.status_label.config(text=f"Exporting notes to '{os.path.basename(path)}'", fg='green')
+            return
+        
+        writer = self.apkg_writer
+        self.apkg_writer = None
+        self.export_btn.config(text="Start .apkg Export")
+        try:
+            writer.close()
+        except Exception as e:
+            writer.discard()
+            self.status_label.config(text=f"Export failed: {e}", fg='red')
+            messagebox.showerror("Error", f"Failed to write package: {e}")
+            return
+        
+        self.status_label.config(text=f"Exported {writer.note_count} notes", fg='green')
+        messagebox.showinfo("Export Complete", f"Wrote {writer.note_count} notes to '{writer.path}'")
+    
     def check_anki_connection(self):
         """Check if AnkiConnect is available"""
         result = self.anki_request("version")
@@ -179,14 +485,194 @@ class AnkiDeckManager:
             self.status_label.config(text="Failed to refresh from Anki", fg='red')
     
     def refresh_deck_list(self):
-        """Refresh the deck listbox"""
-        self.deck_listbox.delete(0, tk.END)
-        for deck_name in sorted(self.saved_decks.keys()):
-            self.deck_listbox.insert(tk.END, deck_name)
-        
+        """Rebuild the deck indexes and redraw the deck tree"""
+        self.build_deck_index()
+        self.populate_deck_tree()
+
         # Clear selection when refreshing
         self.selected_deck = None
         self.update_selected_deck_display()
+
+    def tokenize_deck_name(self, text):
+        """Split a deck name or search query into lowercase search tokens"""
+        return [token for token in re.split(r'[\s:_\-/.,]+', text.lower()) if token]
+
+    def build_deck_index(self):
+        """Build the parent -> children map and the token index for searching"""
+        children = {}
+        tokens = {}
+        known = set()
+
+        for deck_name in self.saved_decks:
+            # Register the deck and any implicit parents (e.g. "A" for "A::B")
+            parts = deck_name.split(self.deck_separator)
+            for depth in range(1, len(parts) + 1):
+                path = self.deck_separator.join(parts[:depth])
+                if path in known:
+                    continue
+                known.add(path)
+                parent = self.deck_separator.join(parts[:depth - 1])
+                children.setdefault(parent, []).append(path)
+
+            for token in self.tokenize_deck_name(deck_name):
+                tokens.setdefault(token, set()).add(deck_name)
+
+        for child_list in children.values():
+            child_list.sort(key=str.lower)
+
+        self.deck_children = children
+        self.deck_tokens = tokens
+        self.sorted_deck_tokens = sorted(tokens)
+
+    def search_decks(self, query):
+        """Return deck names whose tokens start with every term in the query"""
+        matches = None
+        for term in self.tokenize_deck_name(query):
+            # All tokens with this prefix form a contiguous run in the sorted list
+            term_matches = set()
+            start = bisect.bisect_left(self.sorted_deck_tokens, term)
+            end = bisect.bisect_left(self.sorted_deck_tokens, term + '\uffff', start)
+            for index in range(start, end):
+                term_matches |= self.deck_tokens[self.sorted_deck_tokens[index]]
+
+            matches = term_matches if matches is None else matches & term_matches
+            if not matches:
+                return []
+
+        return sorted(matches or [], key=str.lower)
+
+    def get_recent_decks(self):
+        """Return the most recently used decks, newest first"""
+        used = [(info['last_used'], name) for name, info in self.saved_decks.items()
+                if info.get('last_used')]
+        return [name for _, name in heapq.nlargest(self.recent_deck_limit, used)]
+
+    def populate_deck_tree(self):
+        """Redraw the tree: pinned recent decks plus the top level, or search results"""
+        self.deck_tree.delete(*self.deck_tree.get_children())
+        self.deck_item_names = {}
+        self.more_items = {}
+
+        query = self.search_var.get().strip()
+        if query:
+            results = self.search_decks(query)
+            for deck_name in results[:self.search_result_limit]:
+                iid = f"search:{deck_name}"
+                self.deck_tree.insert('', 'end', iid=iid, text=deck_name)
+                self.deck_item_names[iid] = deck_name
+
+            hidden = len(results) - self.search_result_limit
+            if hidden > 0:
+                self.deck_tree.insert('', 'end', iid="search-overflow",
+                                      text=f"... {hidden} more matches, keep typing to narrow down")
+            elif not results:
+                self.deck_tree.insert('', 'end', iid="search-empty", text="No matching decks")
+            return
+
+        recent_decks = self.get_recent_decks()
+        if recent_decks:
+            self.deck_tree.insert('', 'end', iid="recent", text="Recent", open=True)
+            for deck_name in recent_decks:
+                iid = f"recent:{deck_name}"
+                self.deck_tree.insert("recent", 'end', iid=iid, text=deck_name)
+                self.deck_item_names[iid] = deck_name
+
+        self.insert_deck_children('', '')
+
+    def insert_deck_children(self, parent_iid, parent_path, start=0):
+        """Insert one page of child decks under a tree node"""
+        children = self.deck_children.get(parent_path, [])
+        end = start + self.deck_page_size
+
+        for deck_name in children[start:end]:
+            iid = f"deck:{deck_name}"
+            label = deck_name.rsplit(self.deck_separator, 1)[-1]
+            if deck_name in self.saved_decks:
+                self.deck_tree.insert(parent_iid, 'end', iid=iid, text=label)
+                self.deck_item_names[iid] = deck_name
+            else:
+                # Parent implied by "A::B" but not a saved deck: expand-only row
+                self.deck_tree.insert(parent_iid, 'end', iid=iid, text=label, tags=('parent',))
+
+            # Placeholder child so the node can be expanded; replaced on open
+            if deck_name in self.deck_children:
+                self.deck_tree.insert(iid, 'end', iid=f"stub:{deck_name}", text="")
+
+        remaining = len(children) - end
+        if remaining > 0:
+            more_iid = f"more:{parent_path}"
+            self.deck_tree.insert(parent_iid, 'end', iid=more_iid,
+                                  text=f"... show {min(remaining, self.deck_page_size)} more of {remaining}")
+            self.more_items[more_iid] = (parent_iid, parent_path, end)
+
+    def on_deck_open(self, event):
+        """Load the children of a deck node the first time it is expanded"""
+        iid = self.deck_tree.focus()
+        if not iid.startswith("deck:"):
+            return
+
+        deck_name = iid[len("deck:"):]
+        stub_iid = f"stub:{deck_name}"
+        if self.deck_tree.exists(stub_iid):
+            self.deck_tree.delete(stub_iid)
+            self.insert_deck_children(iid, deck_name)
+
+    def on_search_change(self, *args):
+        """Debounce type-ahead search so the tree is redrawn once typing pauses"""
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(self.search_delay_ms, self.run_search)
+
+    def run_search(self):
+        """Redraw the tree for the current search text"""
+        self.search_job = None
+        self.populate_deck_tree()
+        # Redrawing clears the tree selection but must not change the target deck
+        self.select_deck_row(self.selected_deck)
+
+    def select_deck_row(self, deck_name):
+        """Select and scroll to the row for deck_name if it is currently shown"""
+        if not deck_name:
+            return
+        for prefix in ("search:", "deck:", "recent:"):
+            iid = f"{prefix}{deck_name}"
+            if iid in self.deck_item_names:
+                self.deck_tree.selection_set(iid)
+                self.deck_tree.see(iid)
+                return
+
+    def mark_deck_used(self, deck_name):
+        """Record that a deck was just used and refresh the pinned recent decks"""
+        if deck_name not in self.saved_decks:
+            return
+
+        self.saved_decks[deck_name]['last_used'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+        self.save_deck_data()
+
+        # Rebuild only the pinned section so expanded nodes stay as they are
+        if self.search_var.get().strip():
+            return
+        selected_iid = self.deck_tree.selection()
+        if self.deck_tree.exists("recent"):
+            for iid in self.deck_tree.get_children("recent"):
+                self.deck_item_names.pop(iid, None)
+            self.deck_tree.delete("recent")
+        self.deck_tree.insert('', 0, iid="recent", text="Recent", open=True)
+        for name in self.get_recent_decks():
+            iid = f"recent:{name}"
+            self.deck_tree.insert("recent", 'end', iid=iid, text=name)
+            self.deck_item_names[iid] = name
+
+        # Keep the deck selected if its row was part of the rebuilt section
+        if selected_iid and not self.deck_tree.exists(selected_iid[0]):
+            self.select_deck_row(deck_name)
+
+    def get_tree_selection(self):
+        """Return the deck name of the selected tree row, if any"""
+        selection = self.deck_tree.selection()
+        if not selection:
+            return None
+        return self.deck_item_names.get(selection[0])
     
     def add_deck(self):
         """Add a new deck"""
@@ -222,12 +708,11 @@ class AnkiDeckManager:
     
     def edit_deck(self):
         """Edit selected deck"""
-        selection = self.deck_listbox.curselection()
-        if not selection:
+        old_name = self.get_tree_selection()
+        if old_name not in self.saved_decks:
             messagebox.showwarning("No Selection", "Please select a deck to edit")
             return
         
-        old_name = self.deck_listbox.get(selection[0])
         new_name = simpledialog.askstring("Edit Deck", f"Edit deck name:", initialvalue=old_name)
         
         if new_name and new_name.strip() and new_name != old_name:
@@ -253,13 +738,11 @@ class AnkiDeckManager:
     
     def delete_deck(self):
         """Delete selected deck"""
-        selection = self.deck_listbox.curselection()
-        if not selection:
+        deck_name = self.get_tree_selection()
+        if deck_name not in self.saved_decks:
             messagebox.showwarning("No Selection", "Please select a deck to delete")
             return
         
-        deck_name = self.deck_listbox.get(selection[0])
-        
         if messagebox.askyesno("Confirm Delete", 
                               f"Are you sure you want to delete '{deck_name}' from the list?\n"
                               f"(This won't delete the deck from Anki)"):
@@ -274,23 +757,25 @@ class AnkiDeckManager:
             self.update_selected_deck_display()
             self.status_label.config(text=f"Deck '{deck_name}' removed from list", fg='green')
     
-    def on_deck_click(self, event):
-        """Handle deck click (for immediate selection)"""
-        # Use after_idle to ensure the selection has been processed
-        self.root.after_idle(self.update_deck_selection)
-    
     def on_deck_select(self, event):
         """Handle deck selection"""
+        selection = self.deck_tree.selection()
+        if selection and selection[0] in self.more_items:
+            # "Show more" row: swap it for the next page of decks
+            parent_iid, parent_path, start = self.more_items.pop(selection[0])
+            self.deck_tree.delete(selection[0])
+            self.insert_deck_children(parent_iid, parent_path, start)
+            return
+        
         self.update_deck_selection()
     
     def update_deck_selection(self):
-        """Update the selected deck based on current listbox selection"""
-        selection = self.deck_listbox.curselection()
-        if selection:
-            deck_name = self.deck_listbox.get(selection[0])
+        """Update the selected deck based on current tree selection"""
+        # Rows that are not decks (headers, implied parents) and the empty
+        # selection left by a redraw keep the current target deck
+        deck_name = self.get_tree_selection()
+        if deck_name:
             self.selected_deck = deck_name
-        else:
-            self.selected_deck = None
         
         self.update_selected_deck_display()
     
@@ -310,17 +795,17 @@ class AnkiDeckManager:
                 if win32clipboard.IsClipboardFormatAvailable(win32clipboard.RegisterClipboardFormat("HTML Format")):
                     html_data = win32clipboard.GetClipboardData(win32clipboard.RegisterClipboardFormat("HTML Format"))
                     if html_data:
-                        # Parse HTML from clipboard
-                        html_str = html_data.decode('utf-8', errors='ignore')
-                        # Extract the HTML content between StartHTML and EndHTML
-                        start_match = re.search(r'StartHTML:(\d+)', html_str)
-                        end_match = re.search(r'EndHTML:(\d+)', html_str)
+                        # Extract the HTML content between StartHTML and EndHTML.
+                        # The offsets are byte offsets in a small header, so slice the
+                        # bytes through a memoryview and decode only once.
+                        header = html_data[:1024]
+                        start_match = re.search(rb'StartHTML:(\d+)', header)
+                        end_match = re.search(rb'EndHTML:(\d+)', header)
                         if start_match and end_match:
                             start_pos = int(start_match.group(1))
                             end_pos = int(end_match.group(1))
-                            html_content = html_str[start_pos:end_pos]
-                            return html_content
-                        return html_str
+                            return str(memoryview(html_data)[start_pos:end_pos], 'utf-8', 'ignore')
+                        return html_data.decode('utf-8', errors='ignore')
             finally:
                 win32clipboard.CloseClipboard()
         except Exception as e:
@@ -349,65 +834,109 @@ class AnkiDeckManager:
             return html_content, []
         
         images_stored = []
+        pieces = []
+        pos = 0
+        marker = 'data:image/'
+        marker_pattern = re.compile(re.escape(marker), re.IGNORECASE)
         
-        # Find all img tags with base64 data
-        img_pattern = re.compile(r'<img[^>]*src="data:image/([^;]+);base64,([^"]+)"[^>]*>', re.IGNORECASE)
-        
-        def replace_img(match):
-            img_format = match.group(1)
-            img_data = match.group(2)
+        # Scan for data URIs with plain searches instead of a backtracking regex:
+        # the base64 payload can be tens of megabytes and is never copied as a whole
+        while True:
+            marker_match = marker_pattern.search(html_content, pos)
+            if not marker_match:
+                break
+            uri_start = marker_match.start()
+            
+            tag_start = html_content.rfind('<', pos, uri_start)
+            data_end = html_content.find('"', uri_start)
+            tag_end = html_content.find('>', data_end) if data_end != -1 else -1
+            # The media type (which may carry parameters) ends at the first comma;
+            # base64 never contains one, so the search stops at the header
+            header_end = html_content.find(',', uri_start, data_end) if data_end != -1 else -1
+            
+            # Only handle base64 data URIs that are the quoted src of an <img> tag
+            if (tag_start == -1 or header_end == -1 or tag_end == -1
+                    or not html_content[uri_start:header_end].lower().endswith(';base64')
+                    or html_content[tag_start:tag_start + 4].lower() != '<img'
+                    or html_content.find('>', tag_start, uri_start) != -1
+                    or html_content[uri_start - 5:uri_start].lower() != 'src="'):
+                pieces.append(html_content[pos:uri_start + len(marker)])
+                pos = uri_start + len(marker)
+                continue
+            
+            pieces.append(html_content[pos:tag_start])
+            # The tag without its payload, used for the style attribute
+            tag_attributes = html_content[tag_start:uri_start] + html_content[data_end:tag_end + 1]
             
             try:
-                # Decode base64 image
-                image_bytes = base64.b64decode(img_data)
-                
-                # Create PIL image
-                image = Image.open(BytesIO(image_bytes))
-                
-                # Scale image to 125% of original size
-                original_width, original_height = image.size
-                new_width = int(original_width * 1.25)
-                new_height = int(original_height * 1.25)
-                image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                
-                # Generate filename
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-                filename = f"clipboard_img_{timestamp}.{img_format.lower()}"
-                
-                # Convert image back to base64 for Anki storage
-                buffer = BytesIO()
-                if image.mode in ('RGBA', 'LA', 'P'):
-                    image = image.convert('RGB')
-                image.save(buffer, format='PNG')
-                img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-                
-                # Store in Anki media
-                media_result = self.anki_request("storeMediaFile", filename=filename, data=img_base64)
-                
-                if media_result and not media_result.get('error'):
-                    images_stored.append(filename)
-                    original_tag = match.group(0)
-                    style_match = re.search(r'style="([^"]*)"', original_tag)
-                    if style_match:
-                        style = style_match.group(1)
-                        if "max-width" not in style.lower():
-                            style += "; max-width: 140%; height: auto;"
-                        else:
-                            style = re.sub(r'max-width:\s*[^;]+', 'max-width: 140%', style)
-                    else:
-                        style = "max-width: 140%; height: auto;"
+                with tempfile.SpooledTemporaryFile(max_size=self.image_spool_size) as image_file:
+                    self.decode_base64_to_file(html_content, header_end + 1, data_end, image_file)
+                    image_file.seek(0)
                     
-                    return f'<img src="{filename}" style="{style}">'
-                else:
-                    print(f"Failed to store image: {media_result.get('error') if media_result else 'Unknown error'}")
-                    return match.group(0)
+                    # Generate filename (store_scaled_image always writes PNG)
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+                    filename = f"clipboard_img_{timestamp}.png"
                     
+                    with Image.open(image_file) as image:
+                        media_result, _ = self.store_scaled_image(image, filename)
             except Exception as e:
                 print(f"Error processing embedded image: {e}")
-                return match.group(0)
+                media_result = None
+            
+            if media_result and not media_result.get('error'):
+                images_stored.append(filename)
+                style_match = re.search(r'style="([^"]*)"', tag_attributes)
+                if style_match:
+                    style = style_match.group(1)
+                    if "max-width" not in style.lower():
+                        style += "; max-width: 140%; height: auto;"
+                    else:
+                        style = re.sub(r'max-width:\s*[^;]+', 'max-width: 140%', style)
+                else:
+                    style = "max-width: 140%; height: auto;"
+                
+                pieces.append(f'<img src="{filename}" style="{style}">')
+            else:
+                if media_result is not None:
+                    print(f"Failed to store image: {media_result.get('error')}")
+                pieces.append(html_content[tag_start:tag_end + 1])
+            
+            pos = tag_end + 1
+        
+        pieces.append(html_content[pos:])
+        return ''.join(pieces), images_stored
+    
+    def decode_base64_to_file(self, text, start, end, out_file):
+        """Decode text[start:end] as base64 into out_file, one chunk at a time"""
+        pending = ""
+        for chunk_start in range(start, end, self.base64_chunk_size):
+            chunk = pending + text[chunk_start:min(chunk_start + self.base64_chunk_size, end)]
+            # Clipboard HTML may wrap the payload; whitespace would break 4-char alignment
+            chunk = ''.join(chunk.split())
+            usable = len(chunk) - len(chunk) % 4
+            out_file.write(base64.b64decode(chunk[:usable]))
+            pending = chunk[usable:]
+        
+        if pending:
+            out_file.write(base64.b64decode(pending + '=' * (-len(pending) % 4)))
+    
+    def store_scaled_image(self, image, filename):
+        """Scale an image to 125%, save it as PNG and store it in Anki media by file path"""
+        original_width, original_height = image.size
+        new_size = (int(original_width * 1.25), int(original_height * 1.25))
+        scaled_image = image.resize(new_size, Image.Resampling.LANCZOS)
+        if scaled_image.mode in ('RGBA', 'LA', 'P'):
+            scaled_image = scaled_image.convert('RGB')
         
-        processed_html = img_pattern.sub(replace_img, html_content)
-        return processed_html, images_stored
+        # Write the PNG to disk so it never has to be base64-encoded in memory
+        png_fd, png_path = tempfile.mkstemp(suffix='.png')
+        os.close(png_fd)
+        try:
+            scaled_image.save(png_path, format='PNG')
+            scaled_image.close()
+            return self.store_media_file(filename, png_path), new_size
+        finally:
+            os.remove(png_path)
     
     def rtf_to_html(self, rtf_content):
         """Convert RTF to HTML (basic conversion)"""
@@ -434,6 +963,8 @@ class AnkiDeckManager:
         if html_content:
             print("DEBUG: Found HTML content in clipboard")
             processed_html, stored_images = self.extract_images_from_html(html_content)
+            # Drop the raw clipboard HTML, which may hold megabytes of base64
+            html_content = None
             if stored_images:
                 print(f"DEBUG: Stored {len(stored_images)} images from HTML")
             
@@ -560,7 +1091,7 @@ class AnkiDeckManager:
             messagebox.showwarning("No Deck Selected", "Please select a deck first")
             return
         
-        if not self.check_anki_connection():
+        if not self.apkg_writer and not self.check_anki_connection():
             return
         
         try:
@@ -582,21 +1113,11 @@ class AnkiDeckManager:
             
             if standalone_image and not clipboard_content.strip():
                 print("DEBUG: Processing standalone image")
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
                 filename = f"clipboard_image_{timestamp}.png"
                 
                 original_width, original_height = standalone_image.size
-                new_width = int(original_width * 1.25)
-                new_height = int(original_height * 1.25)
-                scaled_image = standalone_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                
-                buffer = BytesIO()
-                if scaled_image.mode in ('RGBA', 'LA', 'P'):
-                    scaled_image = scaled_image.convert('RGB')
-                scaled_image.save(buffer, format='PNG')
-                img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-                
-                media_result = self.anki_request("storeMediaFile", filename=filename, data=img_base64)
+                media_result, (new_width, new_height) = self.store_scaled_image(standalone_image, filename)
                 
                 if media_result and not media_result.get('error'):
                     front_content = f'<img src="{filename}" style="max-width: 140%; height: auto;">'
@@ -619,10 +1140,11 @@ class AnkiDeckManager:
                 "tags": ["clipboard-import", "front-only"]
             }
             
-            result = self.anki_request("addNote", note=note_data)
+            result = self.add_note(note_data)
             
             if result and result.get('error') is None:
                 note_id = result.get('result')
+                self.mark_deck_used(self.selected_deck)
                 self.status_label.config(text=f"Note created successfully (ID: {note_id})", fg='green')
                 messagebox.showinfo("Success", f"Note added to deck '{self.selected_deck}'!{image_info}")
             else:
@@ -693,6 +1215,14 @@ class AnkiDeckManager:
             self.root.mainloop()
         except KeyboardInterrupt:
             self.root.quit()
+        finally:
+            # Don't lose notes from an export that was never finished
+            if self.apkg_writer:
+                try:
+                    self.apkg_writer.close()
+                except Exception as e:
+                    print(f"Error finishing .apkg export: {e}")
+                    self.apkg_writer.discard()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,120 @@
+"""Benchmark peak memory of extract_images_from_html on large pasted screenshots.
+
+Builds clipboard-style HTML with several high-resolution PNGs embedded as
+base64 data URIs, runs the embedded-image pipeline with media storage stubbed
+out, and reports the tracemalloc peak (Python allocations only) and the
+process peak RSS (which also covers Pillow's C-side image buffers).
+
+    python bench_clipboard_images.py --images 4 --width 1600 --height 1200
+
+Run it with different --images counts: peak memory above the input size
+should stay roughly flat, because images are decoded and stored one at a time.
+"""
+import argparse
+import base64
+import importlib.util
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+from PIL import Image
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "Transfer Any Article or Note to Anki.py")
+
+
+def load_app_module():
+    """Import the app script, whose file name is not a valid module name"""
+    spec = importlib.util.spec_from_file_location("anki_note_creator", APP_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb():
+    """Return the process peak resident set size in MB, or None if unavailable"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes on Linux
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    # Windows reports the peak working set; elsewhere fall back to current RSS
+    return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+
+
+def build_payload(image_count, width, height):
+    """Build clipboard HTML with image_count noisy PNG screenshots as data URIs"""
+    buffer = BytesIO()
+    # Random pixels defeat PNG compression, like a worst-case screenshot
+    Image.frombytes('RGB', (width, height), os.urandom(width * height * 3)).save(buffer, format='PNG')
+    img_base64 = base64.b64encode(buffer.getvalue()).decode('ascii')
+    del buffer
+
+    # Join shared pieces so building the payload doesn't copy the base64 per
+    # image and set a peak RSS higher than the extraction being measured
+    pieces = []
+    for i in range(image_count):
+        pieces += [f'<p>Screenshot {i}</p><img style="width: 100%" src="data:image/png;base64,',
+                   img_base64, '">']
+    return ''.join(pieces)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=4, help="number of embedded images")
+    parser.add_argument('--width', type=int, default=1600, help="image width in pixels")
+    parser.add_argument('--height', type=int, default=1200, help="image height in pixels")
+    args = parser.parse_args()
+
+    app = load_app_module()
+
+    # Skip __init__, which opens the Tk window; set only what the pipeline reads
+    manager = app.AnkiDeckManager.__new__(app.AnkiDeckManager)
+    manager.apkg_writer = None
+    manager.image_spool_size = 1024 * 1024
+    manager.base64_chunk_size = 64 * 1024
+
+    stored_bytes = []
+
+    def store_media_file(filename, path):
+        stored_bytes.append(os.path.getsize(path))
+        return {'result': filename, 'error': None}
+
+    manager.store_media_file = store_media_file
+
+    html_content = build_payload(args.images, args.width, args.height)
+    input_mb = len(html_content) / (1024 * 1024)
+    rss_before = peak_rss_mb()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    processed_html, stored_images = manager.extract_images_from_html(html_content)
+    elapsed = time.perf_counter() - start
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = peak_rss_mb()
+
+    print(f"images:              {len(stored_images)} of {args.images} stored "
+          f"({sum(stored_bytes) / (1024 * 1024):.1f} MB PNG written)")
+    print(f"input HTML:          {input_mb:.1f} MB -> output {len(processed_html)} chars")
+    print(f"time:                {elapsed:.2f} s")
+    print(f"tracemalloc peak:    {traced_peak / (1024 * 1024):.1f} MB (Python allocations only)")
+    if rss_after is None:
+        print("peak RSS:            unavailable (install psutil)")
+    else:
+        print(f"peak RSS:            {rss_after:.1f} MB "
+              f"(was {rss_before:.1f} MB after building the payload)")
+
+
+if __name__ == "__main__":
+    main()
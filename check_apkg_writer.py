@@ -0,0 +1,184 @@
+"""Check that ApkgWriter produces a package Anki can import.
+
+Builds a small .apkg with ApkgWriter and inspects it directly: the zip layout,
+the media map, the col row (schema version 11, the fixed "Basic" note type and
+the decks), and that notes, cards and decks reference each other with the
+sort field and checksum Anki expects.
+
+If the `anki` Python package is installed (pip install anki), the package is
+also imported twice into a fresh collection to confirm that Anki accepts it,
+that notes, cards, decks and media arrive, and that the repeat import reuses
+the same note type instead of adding a copy.
+
+    python check_apkg_writer.py
+
+Exits with status 1 if any check fails.
+"""
+import hashlib
+import html
+import importlib.util
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import zipfile
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "Transfer Any Article or Note to Anki.py")
+
+NOTES = [
+    ("Check::Parent::Child", '<b style="color: #facc15;">Bold &amp; front</b>', "", ["clipboard-import", "front-only"]),
+    ("Check::Parent::Child", '<img src="check_img_1.png" style="max-width: 140%; height: auto;">', "", []),
+    ("Check::Other", "Plain front", "Back text", ["clipboard-import"]),
+]
+MEDIA = {"check_img_1.png": b"\x89PNG first image", "check_img_2.png": b"\x89PNG second image"}
+
+failures = []
+
+
+def check(condition, message):
+    """Record a failed check without stopping the remaining ones"""
+    if not condition:
+        failures.append(message)
+        print(f"FAIL: {message}")
+
+
+def load_app_module():
+    """Import the app script, whose file name is not a valid module name"""
+    spec = importlib.util.spec_from_file_location("anki_note_creator", APP_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_package(writer_class, work_dir, package_name):
+    """Write NOTES and MEDIA into a new package and return its path"""
+    package_path = os.path.join(work_dir, package_name)
+    writer = writer_class(package_path)
+    for deck_name, front, back, tags in NOTES:
+        writer.add_note(deck_name, front, back, tags)
+
+    for filename, data in MEDIA.items():
+        media_path = os.path.join(work_dir, filename)
+        with open(media_path, 'wb') as f:
+            f.write(data)
+        writer.add_media(filename, media_path)
+
+    try:
+        writer.add_media("check_img_1.png", os.path.join(work_dir, "check_img_1.png"))
+        check(False, "duplicate media filename was accepted")
+    except ValueError:
+        pass
+
+    writer.close()
+    return package_path
+
+
+def check_package_contents(writer_class, package_path, work_dir):
+    """Inspect the zip, media map and collection database"""
+    with zipfile.ZipFile(package_path) as package:
+        names = set(package.namelist())
+        check(names == {"collection.anki2", "media", "0", "1"}, f"unexpected zip entries {sorted(names)}")
+
+        media_map = json.loads(package.read("media"))
+        check(set(media_map.values()) == set(MEDIA), f"media map names {media_map}")
+        for entry_name, filename in media_map.items():
+            check(package.read(entry_name) == MEDIA.get(filename),
+                  f"media entry {entry_name} does not hold {filename}")
+
+        package.extract("collection.anki2", work_dir)
+
+    db = sqlite3.connect(os.path.join(work_dir, "collection.anki2"))
+    try:
+        check(db.execute("PRAGMA integrity_check").fetchone()[0] == "ok", "collection fails integrity_check")
+
+        col_rows = db.execute("SELECT ver, models, decks FROM col").fetchall()
+        check(len(col_rows) == 1, f"expected one col row, found {len(col_rows)}")
+        ver, models_json, decks_json = col_rows[0]
+        check(ver == 11, f"col ver is {ver}, expected 11")
+
+        models = json.loads(models_json)
+        model = models.get(str(writer_class.MODEL_ID))
+        check(model is not None, f"models {list(models)} lack MODEL_ID {writer_class.MODEL_ID}")
+        if model:
+            check(model["name"] == "Basic", f"model name is {model['name']!r}")
+            check([field["name"] for field in model["flds"]] == ["Front", "Back"], "model fields are not Front/Back")
+
+        deck_names = {int(deck_id): deck["name"] for deck_id, deck in json.loads(decks_json).items()}
+
+        notes = db.execute("SELECT id, mid, flds, sfld, csum, tags FROM notes ORDER BY id").fetchall()
+        check(len(notes) == len(NOTES), f"found {len(notes)} notes, expected {len(NOTES)}")
+        for (note_id, mid, flds, sfld, csum, tags), (deck_name, front, back, note_tags) in zip(notes, NOTES):
+            check(mid == writer_class.MODEL_ID, f"note {note_id} uses model {mid}")
+            check(flds.split("\x1f") == [front, back], f"note {note_id} fields {flds!r}")
+            sort_field = html.unescape(re.sub(r'<[^>]+>', '', front)).strip()
+            check(sfld == sort_field, f"note {note_id} sfld {sfld!r}, expected {sort_field!r}")
+            expected_csum = int(hashlib.sha1(sort_field.encode('utf-8')).hexdigest()[:8], 16)
+            check(csum == expected_csum, f"note {note_id} csum {csum}, expected {expected_csum}")
+            check(tags.split() == note_tags, f"note {note_id} tags {tags!r}")
+
+            cards = db.execute("SELECT did, ord, type, queue FROM cards WHERE nid = ?", (note_id,)).fetchall()
+            check(len(cards) == 1, f"note {note_id} has {len(cards)} cards")
+            if cards:
+                did, card_ord, card_type, queue = cards[0]
+                check(deck_names.get(did) == deck_name,
+                      f"note {note_id} card is in deck {deck_names.get(did)!r}, expected {deck_name!r}")
+                check((card_ord, card_type, queue) == (0, 0, 0), f"note {note_id} card is not a new card")
+
+        orphans = db.execute("SELECT count(*) FROM cards WHERE nid NOT IN (SELECT id FROM notes)").fetchone()[0]
+        check(orphans == 0, f"{orphans} cards have no note")
+    finally:
+        db.close()
+
+
+def check_anki_import(package_paths, work_dir):
+    """Import the packages into a fresh collection with the real Anki backend"""
+    try:
+        from anki.collection import Collection
+        from anki.import_export_pb2 import ImportAnkiPackageRequest
+    except ImportError:
+        print("SKIP: anki package not installed, real import not checked (pip install anki)")
+        return
+
+    col = Collection(os.path.join(work_dir, "import_check.anki2"))
+    try:
+        notetype_counts = []
+        for package_path in package_paths:
+            col.import_anki_package(ImportAnkiPackageRequest(package_path=package_path))
+            notetype_counts.append(len(col.models.all_names_and_ids()))
+
+        check(col.note_count() == len(NOTES) * len(package_paths),
+              f"Anki imported {col.note_count()} notes, expected {len(NOTES) * len(package_paths)}")
+        check(col.card_count() == len(NOTES) * len(package_paths),
+              f"Anki imported {col.card_count()} cards")
+        check(notetype_counts[0] == notetype_counts[-1],
+              f"repeat import added note types: counts {notetype_counts}")
+        for deck_name in {note[0] for note in NOTES}:
+            check(col.decks.id_for_name(deck_name) is not None, f"deck {deck_name!r} missing after import")
+        # Anki only copies media that some note references, which the app always does
+        for filename in MEDIA:
+            if any(filename in front for _, front, _, _ in NOTES):
+                check(col.media.have(filename), f"media {filename!r} missing after import")
+        print(f"Anki import checked with anki backend ({len(package_paths)} imports)")
+    finally:
+        col.close()
+
+
+def main():
+    app = load_app_module()
+    with tempfile.TemporaryDirectory() as work_dir:
+        first = build_package(app.ApkgWriter, work_dir, "first.apkg")
+        second = build_package(app.ApkgWriter, work_dir, "second.apkg")
+        check_package_contents(app.ApkgWriter, first, work_dir)
+        check_anki_import([first, second], work_dir)
+
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("All package checks passed")
+
+
+if __name__ == "__main__":
+    main()